@@ -0,0 +1,385 @@
+import os
+import re
+import sys
+import json
+import gzip
+import shutil
+import hashlib
+import argparse
+import configparser
+import logging
+from datetime import datetime
+
+# Instantáneas de datos de hipercubos para comprobar regresiones tras una recarga.
+# Los datos se piden al Engine en ventanas acotadas (GetHyperCubeData) y se
+# escriben por columnas en ficheros gzip, una línea por celda, de modo que la
+# memoria usada no depende del número de filas. El manifiesto guarda un hash por
+# columna, así que comparar dos instantáneas no obliga a releer los datos salvo
+# en las columnas que han cambiado. Cada ejecución se guarda en data/<etiqueta>/
+# (por defecto la fecha y hora), para poder comparar antes y después de recargar;
+# sólo se conservan las DEFAULT_KEEP_RUNS ejecuciones más recientes.
+
+SNAPSHOT_DIR = "data"
+SPECS_FILE = "snapshot_specs.json"
+MAX_CELLS_PER_PAGE = 10000
+DEFAULT_PAGE_ROWS = 2000
+RUN_FILE = "run.json"
+# Ejecuciones que se conservan por app; la más antigua se borra al crear una nueva
+DEFAULT_KEEP_RUNS = 10
+
+
+def _safe_name(name):
+    return re.sub(r"[^\w\-.]", "_", name).strip(".") or "snapshot"
+
+
+def _column_file(i):
+    return f"col_{i:03d}.jsonl.gz"
+
+
+def new_label():
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def snapshot_folder(output_folder, label):
+    return os.path.join(output_folder, SNAPSHOT_DIR, _safe_name(label))
+
+
+def _run_created(folder):
+    # Fecha de creación guardada en run.json; no cambia al repetir una etiqueta
+    try:
+        with open(os.path.join(folder, RUN_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)["created"]
+    except Exception:
+        return ""
+
+
+def list_labels(output_folder):
+    # Etiquetas existentes, de la más antigua a la más reciente
+    data_dir = os.path.join(output_folder, SNAPSHOT_DIR)
+    if not os.path.isdir(data_dir):
+        return []
+    labels = [n for n in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, n))]
+    return sorted(labels, key=lambda n: (_run_created(os.path.join(data_dir, n)), n))
+
+
+def prune_runs(output_folder, current, keep=DEFAULT_KEEP_RUNS):
+    # Borra las ejecuciones más antiguas hasta dejar keep contando la actual (None o 0: sin límite)
+    if not keep:
+        return []
+    labels = [label for label in list_labels(output_folder) if label != current]
+    removed = labels[:max(0, len(labels) - keep + 1)]
+    for label in removed:
+        logging.info(f"Eliminando instantánea antigua: {label}")
+        shutil.rmtree(os.path.join(output_folder, SNAPSHOT_DIR, label), ignore_errors=True)
+    return removed
+
+
+def load_specs(output_folder):
+    # Especificaciones definidas por el usuario junto a la exportación, p. ej.
+    # [{"name": "ventas", "object_id": "abc"},
+    #  {"name": "kpis", "dimensions": ["<qLibraryId>"], "measures": ["<qLibraryId>"]}]
+    path = os.path.join(output_folder, SPECS_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _library_def(item, kind):
+    # Cadena -> elemento maestro; diccionario -> definición del Engine tal cual
+    if isinstance(item, str):
+        return {"qLibraryId": item}
+    if kind == "dimension" and "qDef" not in item and "qLibraryId" not in item and "field" in item:
+        return {"qDef": {"qFieldDefs": [item["field"]]}}
+    return item
+
+
+def _open_hypercube(ws, doc_handle, spec):
+    # Devuelve (handle, id del objeto de sesión o None) del hipercubo a paginar
+    from engine_exporter import send
+
+    if spec.get("object_id"):
+        obj = send(ws, "GetObject", handle=doc_handle, params=[spec["object_id"]])
+        return obj["result"]["qReturn"]["qHandle"], None
+
+    hypercube_def = {
+        "qDimensions": [_library_def(d, "dimension") for d in spec.get("dimensions", [])],
+        "qMeasures": [_library_def(m, "measure") for m in spec.get("measures", [])],
+        "qSuppressZero": False,
+        "qSuppressMissing": False,
+        "qInitialDataFetch": [],
+    }
+    obj = send(ws, "CreateSessionObject", handle=doc_handle, params=[{
+        "qInfo": {"qType": "qvc-snapshot"},
+        "qHyperCubeDef": hypercube_def,
+    }])
+    if "result" not in obj:
+        raise RuntimeError(f"No se pudo crear el hipercubo: {obj}")
+    return obj["result"]["qReturn"]["qHandle"], obj["result"]["qReturn"]["qGenericId"]
+
+
+def export_snapshot(ws, doc_handle, spec, target_folder, page_rows=DEFAULT_PAGE_ROWS, progress=None):
+    # target_folder: carpeta de la etiqueta (snapshot_folder)
+    from engine_exporter import send
+
+    name = _safe_name(spec["name"])
+    handle, session_id = _open_hypercube(ws, doc_handle, spec)
+    try:
+        layout = send(ws, "GetLayout", handle=handle)["result"]["qLayout"]
+        if "qHyperCube" not in layout:
+            raise RuntimeError("El objeto no contiene un hipercubo en /qHyperCubeDef")
+        hypercube = layout["qHyperCube"]
+        if hypercube.get("qMode", "S") != "S":
+            raise RuntimeError(f"Modo de hipercubo no soportado: {hypercube.get('qMode')}")
+
+        columns = [d.get("qFallbackTitle", "") for d in hypercube.get("qDimensionInfo", [])]
+        columns += [m.get("qFallbackTitle", "") for m in hypercube.get("qMeasureInfo", [])]
+        width = hypercube["qSize"]["qcx"]
+        columns += [f"col_{i}" for i in range(len(columns), width)]
+        total_rows = hypercube["qSize"]["qcy"]
+        height = max(1, min(page_rows, MAX_CELLS_PER_PAGE // max(width, 1)))
+
+        target = os.path.join(target_folder, name)
+        tmp_target = target + ".tmp"
+        shutil.rmtree(tmp_target, ignore_errors=True)
+        os.makedirs(tmp_target)
+        try:
+            manifest = _write_pages(ws, handle, spec, tmp_target, columns, width, total_rows, height, progress)
+        except BaseException:
+            # No dejar carpetas .tmp a medias (error o cancelación)
+            shutil.rmtree(tmp_target, ignore_errors=True)
+            raise
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_target, target)
+        logging.info(f"Instantánea '{spec['name']}' exportada: {manifest['rows']} filas, {width} columnas.")
+        return manifest
+    finally:
+        if session_id:
+            # Si la conexión se ha roto, que se propague el error original
+            try:
+                send(ws, "DestroySessionObject", handle=doc_handle, params=[session_id])
+            except Exception as e:
+                logging.debug(f"No se pudo destruir el objeto de sesión {session_id}: {e}")
+
+
+def _write_pages(ws, handle, spec, tmp_target, columns, width, total_rows, height, progress):
+    # Pagina el hipercubo y escribe cada columna en su fichero gzip; devuelve el manifiesto
+    from engine_exporter import send
+
+    name = _safe_name(spec["name"])
+    hashes = [hashlib.sha1() for _ in range(width)]
+    writers = [
+        gzip.open(os.path.join(tmp_target, _column_file(i)), "wt", encoding="utf-8")
+        for i in range(width)
+    ]
+    rows = 0
+    try:
+        for top in range(0, total_rows, height):
+            reply = send(ws, "GetHyperCubeData", handle=handle, params={
+                "qPath": "/qHyperCubeDef",
+                "qPages": [{"qTop": top, "qLeft": 0, "qWidth": width, "qHeight": height}],
+            })
+            if "result" not in reply:
+                raise RuntimeError(f"Error al paginar el hipercubo: {reply}")
+            for row in reply["result"]["qDataPages"][0]["qMatrix"]:
+                for i, cell in enumerate(row):
+                    line = json.dumps([cell.get("qText"), cell.get("qNum")], ensure_ascii=False) + "\n"
+                    writers[i].write(line)
+                    hashes[i].update(line.encode("utf-8"))
+                rows += 1
+            logging.debug(f"Instantánea {name}: {rows}/{total_rows} filas")
+            if progress:
+                progress(f"Instantánea {spec['name']}: {rows}/{total_rows} filas")
+    finally:
+        for writer in writers:
+            writer.close()
+
+    manifest = {
+        "name": spec["name"],
+        "spec": spec,
+        "rows": rows,
+        "columns": [
+            {"title": title, "file": _column_file(i), "sha1": hashes[i].hexdigest()}
+            for i, title in enumerate(columns[:width])
+        ],
+    }
+    with open(os.path.join(tmp_target, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def export_snapshots(ws, doc_handle, specs, output_folder, label=None, page_rows=DEFAULT_PAGE_ROWS, progress=None,
+                     keep=DEFAULT_KEEP_RUNS):
+    # Devuelve la etiqueta usada
+    label = label or new_label()
+    target_folder = snapshot_folder(output_folder, label)
+    os.makedirs(target_folder, exist_ok=True)
+    run_path = os.path.join(target_folder, RUN_FILE)
+    if not os.path.exists(run_path):
+        with open(run_path, "w", encoding="utf-8") as f:
+            json.dump({"label": label, "created": datetime.now().isoformat()}, f)
+
+    # Una excepción lanzada por progress (p. ej. la cancelación de la tarea) detiene
+    # todas las instantáneas; los demás errores sólo afectan a la instantánea en curso
+    aborted = []
+
+    def report(message):
+        try:
+            progress(message)
+        except Exception as e:
+            aborted.append(e)
+            raise
+
+    for spec in specs:
+        try:
+            if progress:
+                report(f"Instantánea {spec.get('name')}...")
+            export_snapshot(ws, doc_handle, spec, target_folder, page_rows, report if progress else None)
+        except Exception as e:
+            if aborted:
+                raise
+            logging.warning(f"No se pudo exportar la instantánea {spec.get('name')}: {e}")
+    prune_runs(output_folder, os.path.basename(target_folder), keep)
+    return label
+
+
+def _read_manifest(folder, name):
+    path = os.path.join(folder, name, "manifest.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _first_difference(path_a, path_b):
+    # Recorre ambas columnas a la vez; devuelve (fila, valor_a, valor_b) o None
+    with gzip.open(path_a, "rt", encoding="utf-8") as fa, gzip.open(path_b, "rt", encoding="utf-8") as fb:
+        row = 0
+        while True:
+            a, b = fa.readline(), fb.readline()
+            if a != b:
+                return row, json.loads(a) if a else None, json.loads(b) if b else None
+            if not a:
+                return None
+            row += 1
+
+
+def compare_snapshots(output_folder, label_a, label_b):
+    # Compara dos ejecuciones de instantáneas de una app (p. ej. antes y después de recargar)
+    folder_a, folder_b = snapshot_folder(output_folder, label_a), snapshot_folder(output_folder, label_b)
+    names = set()
+    for folder in (folder_a, folder_b):
+        if os.path.isdir(folder):
+            names.update(
+                n for n in os.listdir(folder)
+                if not n.endswith(".tmp") and os.path.isdir(os.path.join(folder, n))
+            )
+
+    result = {}
+    for name in sorted(names):
+        a, b = _read_manifest(folder_a, name), _read_manifest(folder_b, name)
+        if a is None or b is None:
+            result[name] = {"status": "missing", "in_a": a is not None, "in_b": b is not None}
+            continue
+
+        # Las columnas se emparejan por posición; los títulos pueden repetirse o venir vacíos
+        changed, renamed = [], []
+        for i in range(max(len(a["columns"]), len(b["columns"]))):
+            column = a["columns"][i] if i < len(a["columns"]) else None
+            other = b["columns"][i] if i < len(b["columns"]) else None
+            if other is None:
+                changed.append({"index": i, "title": column["title"], "difference": "missing_in_b"})
+                continue
+            if column is None:
+                changed.append({"index": i, "title": other["title"], "difference": "missing_in_a"})
+                continue
+            if column["title"] != other["title"]:
+                renamed.append({"index": i, "title_a": column["title"], "title_b": other["title"]})
+            if other["sha1"] != column["sha1"]:
+                difference = _first_difference(
+                    os.path.join(folder_a, name, column["file"]),
+                    os.path.join(folder_b, name, other["file"]),
+                )
+                changed.append({"index": i, "title": column["title"], "difference": difference})
+
+        equal = not changed and not renamed and a["rows"] == b["rows"]
+        result[name] = {
+            "status": "equal" if equal else "changed",
+            "rows": [a["rows"], b["rows"]],
+            "columns": changed,
+            "renamed": renamed,
+        }
+    return result
+
+
+def _specs_from_args(args, output_folder):
+    specs = [{"name": object_id, "object_id": object_id} for object_id in args.object]
+    if args.dimension or args.measure:
+        specs.append({"name": args.name, "dimensions": args.dimension, "measures": args.measure})
+    return specs or load_specs(output_folder)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Instantáneas de datos de una app exportada")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    take = commands.add_parser("take", help="Exportar una instantánea etiquetada")
+    take.add_argument("app_folder", help="Carpeta de la app exportada, p. ej. exported/Ventas")
+    take.add_argument("--server", required=True, help="Sección de config.ini")
+    take.add_argument("--config", default="config.ini")
+    take.add_argument("--app-id", help="Por defecto, el id de metadata.json")
+    take.add_argument("--label", help="Por defecto, la fecha y hora")
+    take.add_argument("--object", action="append", default=[], help="Id de un objeto con hipercubo")
+    take.add_argument("--dimension", action="append", default=[], help="qLibraryId de una dimensión maestra")
+    take.add_argument("--measure", action="append", default=[], help="qLibraryId de una medida maestra")
+    take.add_argument("--name", default="maestros", help="Nombre de la instantánea de dimensiones/medidas")
+    take.add_argument("--keep", type=int, default=DEFAULT_KEEP_RUNS, help="Ejecuciones a conservar (0: todas)")
+
+    compare = commands.add_parser("compare", help="Comparar dos instantáneas")
+    compare.add_argument("app_folder")
+    compare.add_argument("labels", nargs="*", help="Dos etiquetas; por defecto las dos más recientes")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    if args.command == "take":
+        from engine_exporter import export_app_snapshots
+        from qrs_client import connection_from_config
+
+        app_id = args.app_id
+        if not app_id:
+            with open(os.path.join(args.app_folder, "metadata.json"), "r", encoding="utf-8") as f:
+                app_id = json.load(f)["id"]
+        specs = _specs_from_args(args, args.app_folder)
+        if not specs:
+            parser.error(f"No hay objetos indicados ni {SPECS_FILE} en {args.app_folder}")
+        config = configparser.ConfigParser()
+        config.read(args.config)
+        conn = connection_from_config(config, args.server)
+        label = export_app_snapshots(app_id, args.app_folder, conn, specs, label=args.label, keep=args.keep)
+        print(f"Instantánea guardada con la etiqueta '{label}'")
+        return
+
+    labels = args.labels or list_labels(args.app_folder)[-2:]
+    if len(labels) != 2:
+        parser.error("Se necesitan dos etiquetas para comparar")
+    result = compare_snapshots(args.app_folder, *labels)
+    different = False
+    for name, entry in result.items():
+        print(f"{name}: {entry['status']}")
+        if entry["status"] == "missing":
+            different = True
+            continue
+        if entry["status"] == "changed":
+            different = True
+            print(f"  filas: {entry['rows'][0]} -> {entry['rows'][1]}")
+            for column in entry["columns"]:
+                print(f"  columna {column['index']} ({column['title']}): {column['difference']}")
+            for column in entry["renamed"]:
+                print(f"  columna {column['index']} renombrada: {column['title_a']} -> {column['title_b']}")
+    return 1 if different else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
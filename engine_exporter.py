@@ -3,6 +3,9 @@ import json
 import ssl
 import websocket
 import logging
+from script_store import write_script, has_script, read_script
+from data_snapshot import export_snapshots, load_specs, DEFAULT_KEEP_RUNS
+from lineage import refresh_lineage
 
 # Función send integrada
 def send(ws, method, handle, params=None):
@@ -17,7 +20,15 @@ def send(ws, method, handle, params=None):
     response = json.loads(ws.recv())
     return response
 
-def export_app_objects(app_id, output_folder, conn):
+# Registra la etapa y avisa al llamador; progress puede lanzar una excepción para
+# cancelar (quien abrió la conexión la cierra en su finally)
+def checkpoint(progress, message):
+    logging.info(message)
+    if progress:
+        progress(message)
+
+def open_engine_doc(app_id, conn):
+    # Abre la conexión WebSocket con el Engine y el documento; devuelve (ws, doc_handle)
     logging.info("Estableciendo conexión WebSocket con Engine API")
 
     engine_host = conn.get("engine_host", conn["host"].replace("https://", "").split(":" )[0])
@@ -57,18 +68,27 @@ def export_app_objects(app_id, output_folder, conn):
     doc_handle = open_doc["result"]["qReturn"]["qHandle"]
 
     logging.info(f"Documento abierto con handle {doc_handle}")
+    return ws, doc_handle
+
+def export_app_objects(app_id, output_folder, conn, snapshots=None, progress=None, snapshot_label=None):
+    ws, doc_handle = open_engine_doc(app_id, conn)
+    try:
+        _export_doc_objects(ws, doc_handle, output_folder, snapshots, progress, snapshot_label)
+    finally:
+        ws.close()
+    logging.info("Exportación completa y conexión cerrada.")
 
+def _export_doc_objects(ws, doc_handle, output_folder, snapshots, progress, snapshot_label):
     # Exportar script
-    logging.info("Exportando script...")
+    checkpoint(progress, "Exportando script...")
     try:
         script_reply = send(ws, "GetScript", handle=doc_handle)
-        with open(os.path.join(output_folder, "script.qvs"), "w", encoding="utf-8") as f:
-            f.write(script_reply["result"]["qScript"])
+        write_script(script_reply["result"]["qScript"], output_folder)
     except Exception as e:
         logging.warning(f"No se pudo exportar el script: {e}")
 
     # Exportar variables
-    logging.info("Exportando variables...")
+    checkpoint(progress, "Exportando variables...")
     try:
         vars_reply = send(ws, "GetAllVariables", handle=doc_handle, params={"qIncludeReserved": True, "qIncludeConfig": False})
         if "result" in vars_reply and "qVariableList" in vars_reply["result"]:
@@ -81,7 +101,7 @@ def export_app_objects(app_id, output_folder, conn):
         logging.warning(f"No se pudieron obtener las variables: {e}")
 
     # Exportar objetos extendidos
-    logging.info("Exportando objetos extendidos...")
+    checkpoint(progress, "Exportando objetos extendidos...")
     try:
         infos_reply = send(ws, "GetAllInfos", handle=doc_handle)
         infos = infos_reply["result"]["qInfos"]
@@ -90,9 +110,11 @@ def export_app_objects(app_id, output_folder, conn):
         infos = []
 
     measures, dimensions, sheets, others = [], [], [], []
-    for info in infos:
+    for i, info in enumerate(infos):
         qid = info["qId"]
         qtype = info["qType"]
+        if progress:
+            checkpoint(progress, f"Exportando objeto {i + 1}/{len(infos)} ({qtype})")
 
         try:
             if qtype == "measure":
@@ -108,8 +130,13 @@ def export_app_objects(app_id, output_folder, conn):
 
             elif qtype == "sheet":
                 obj = send(ws, "GetObject", handle=doc_handle, params=[qid])
-                prop = send(ws, "GetProperties", handle=obj["result"]["qReturn"]["qHandle"])
-                sheets.append(prop["result"])
+                sheet_handle = obj["result"]["qReturn"]["qHandle"]
+                prop = send(ws, "GetProperties", handle=sheet_handle)
+                sheet = prop["result"]
+                # Los gráficos de la hoja se guardan aparte para el linaje
+                tree = send(ws, "GetFullPropertyTree", handle=sheet_handle)
+                sheet["qChildren"] = tree.get("result", {}).get("qPropEntry", {}).get("qChildren", [])
+                sheets.append(sheet)
 
             else:
                 others.append(info)
@@ -141,10 +168,49 @@ def export_app_objects(app_id, output_folder, conn):
     except Exception as e:
         logging.warning(f"Error al guardar otros objetos: {e}")
 
-    ws.close()
-    logging.info("Exportación completa y conexión cerrada.")
+    # Instantáneas de datos (opcional): las indicadas o las de snapshot_specs.json
+    if snapshots is None:
+        try:
+            snapshots = load_specs(output_folder)
+        except Exception as e:
+            logging.warning(f"No se pudieron leer las instantáneas configuradas: {e}")
+            snapshots = []
+    if snapshots:
+        checkpoint(progress, f"Exportando {len(snapshots)} instantáneas de datos...")
+        export_snapshots(ws, doc_handle, snapshots, output_folder, label=snapshot_label, progress=progress)
+        checkpoint(progress, "Instantáneas de datos exportadas.")
+
+def export_app_snapshots(app_id, output_folder, conn, specs, label=None, progress=None, keep=DEFAULT_KEEP_RUNS):
+    # Sólo instantáneas de datos, sin volver a exportar los objetos de la app
+    ws, doc_handle = open_engine_doc(app_id, conn)
+    try:
+        label = export_snapshots(ws, doc_handle, specs, output_folder, label=label, progress=progress, keep=keep)
+    finally:
+        ws.close()
+    logging.info(f"Instantáneas '{label}' exportadas y conexión cerrada.")
+    return label
+
+def export_app(app, output_folder, conn, progress=None, snapshots=None, snapshot_label=None):
+    # Exportación completa de una app: metadata QRS, objetos y linaje
+    app_id = app.get("id")
+    os.makedirs(output_folder, exist_ok=True)
 
-def import_app_objects(app_id, input_folder, conn):
+    # Guardar metadata QRS
+    with open(os.path.join(output_folder, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(app, f, indent=2)
+
+    export_app_objects(app_id, output_folder, conn, snapshots=snapshots, progress=progress, snapshot_label=snapshot_label)
+
+    # Actualizar el grafo de linaje sólo para esta app
+    root, app_folder = os.path.split(os.path.normpath(output_folder))
+    try:
+        refresh_lineage(root, apps=[app_folder])
+    except Exception as e:
+        logging.warning(f"No se pudo actualizar el linaje: {e}")
+
+    logging.info(f"Exportación completa para {app.get('name')} ({app_id})")
+
+def import_app_objects(app_id, input_folder, conn, progress=None):
     import os, json, logging
     import ssl
     import websocket
@@ -183,16 +249,22 @@ def import_app_objects(app_id, input_folder, conn):
 
     doc_handle = open_doc["result"]["qReturn"]["qHandle"]
     logging.info(f"Documento destino abierto con handle {doc_handle}")
+    try:
+        _import_doc_objects(ws, doc_handle, input_folder, progress)
+    finally:
+        ws.close()
+    logging.info("Importación completada y conexión cerrada.")
 
+def _import_doc_objects(ws, doc_handle, input_folder, progress):
     # Script
-    script_path = os.path.join(input_folder, "script.qvs")
-    if os.path.exists(script_path):
-        with open(script_path, "r", encoding="utf-8") as f:
-            script = f.read()
+    checkpoint(progress, "Importando script...")
+    if has_script(input_folder):
+        script = read_script(input_folder)
         send(ws, "SetScript", handle=doc_handle, params={"qScript": script})
         logging.info("Script importado correctamente.")
 
     # Variables
+    checkpoint(progress, "Importando variables...")
     variables_path = os.path.join(input_folder, "variables.json")
     if os.path.exists(variables_path):
         with open(variables_path, "r", encoding="utf-8") as f:
@@ -204,6 +276,7 @@ def import_app_objects(app_id, input_folder, conn):
         logging.info(f"{len(variables)} variables importadas correctamente.")
 
     # Medidas
+    checkpoint(progress, "Importando medidas...")
     path = os.path.join(input_folder, "measures.json")
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
@@ -214,6 +287,7 @@ def import_app_objects(app_id, input_folder, conn):
         logging.info(f"{len(measures)} medidas importadas correctamente.")
 
     # Dimensiones
+    checkpoint(progress, "Importando dimensiones...")
     path = os.path.join(input_folder, "dimensions.json")
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
@@ -224,6 +298,7 @@ def import_app_objects(app_id, input_folder, conn):
         logging.info(f"{len(dims)} dimensiones importadas correctamente.")
 
     # Hojas
+    checkpoint(progress, "Importando hojas...")
     path = os.path.join(input_folder, "sheets.json")
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
@@ -239,6 +314,3 @@ def import_app_objects(app_id, input_folder, conn):
         with open(path, "r", encoding="utf-8") as f:
             other = json.load(f)
         logging.info(f"{len(other)} objetos ignorados importados como referencia.")
-
-    ws.close()
-    logging.info("Importación completada y conexión cerrada.")
@@ -2,7 +2,7 @@ from PySide6.QtWidgets import QDialog, QVBoxLayout, QDialogButtonBox, QTreeWidge
 from PySide6.QtCore import Qt
 import os
 import json
-import re
+from script_store import has_script, script_tab_names
 
 class ImportDialog(QDialog):
     def __init__(self, input_folder):
@@ -15,18 +15,15 @@ class ImportDialog(QDialog):
         self.tree.setColumnCount(1)
 
         # Script
-        script_path = os.path.join(input_folder, "script.qvs")
         script_item = QTreeWidgetItem(["Script"])
-        if os.path.exists(script_path):
-            with open(script_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                tab_names = re.findall(r"^///\$tab (.+)$", content, flags=re.MULTILINE)
-                if tab_names:
-                    for name in tab_names:
-                        tab_item = QTreeWidgetItem([name.strip() or "Sin nombre"])
-                        script_item.addChild(tab_item)
-                else:
-                    script_item.addChild(QTreeWidgetItem(["Sin pestañas detectadas"]))
+        if has_script(input_folder):
+            tab_names = script_tab_names(input_folder)
+            if tab_names:
+                for name in tab_names:
+                    tab_item = QTreeWidgetItem([name.strip() or "Sin nombre"])
+                    script_item.addChild(tab_item)
+            else:
+                script_item.addChild(QTreeWidgetItem(["Sin pestañas detectadas"]))
         self.tree.addTopLevelItem(script_item)
 
         # Componentes JSON
@@ -0,0 +1,240 @@
+from PySide6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+    QPushButton, QAbstractItemView, QHeaderView
+)
+from PySide6.QtCore import QObject, Signal
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import logging
+
+# Gestor central de tareas en segundo plano. Todas las exportaciones, importaciones
+# y cargas comparten un único pool acotado; los hilos de trabajo sólo se comunican
+# con la interfaz mediante señales Qt, que llegan al hilo de la GUI en cola.
+
+MAX_WORKERS = 4
+
+STATE_QUEUED = "En cola"
+STATE_RUNNING = "En curso"
+STATE_DONE = "Completado"
+STATE_FAILED = "Error"
+STATE_CANCELLED = "Cancelado"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job(QObject):
+    # Señales emitidas desde el hilo de trabajo
+    state_changed = Signal(str)
+    progress = Signal(str)
+    log = Signal(str)
+
+    def __init__(self, job_id, name, key=None):
+        super().__init__()
+        self.job_id = job_id
+        self.name = name
+        self.key = key
+        self.state = STATE_QUEUED
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.log_lines = []
+        self.future = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def active(self):
+        return self.state in (STATE_QUEUED, STATE_RUNNING)
+
+    def cancel(self):
+        self._cancel_event.set()
+        # Si aún no ha empezado, se retira de la cola directamente
+        if self.future is not None and self.future.cancel():
+            self._set_state(STATE_CANCELLED)
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report(self, message):
+        # Punto de control: publica el progreso y aborta si se pidió cancelar
+        if self._cancel_event.is_set():
+            raise JobCancelled("Tarea cancelada por el usuario")
+        self.progress.emit(message)
+
+    def _set_state(self, state):
+        self.state = state
+        self.state_changed.emit(state)
+
+
+class _JobLogHandler(logging.Handler):
+    # Envía cada registro de log a la tarea que se ejecuta en el hilo que lo genera
+    def __init__(self):
+        super().__init__(level=logging.INFO)
+        self.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        self._local = threading.local()
+
+    def bind(self, job):
+        self._local.job = job
+
+    def emit(self, record):
+        job = getattr(self._local, "job", None)
+        if job is not None:
+            job.log.emit(self.format(record))
+
+
+class JobManager(QObject):
+    job_added = Signal(object)
+    job_updated = Signal(object)
+    job_log = Signal(object, str)
+
+    def __init__(self, max_workers=MAX_WORKERS, parent=None):
+        super().__init__(parent)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qvc-job")
+        self._ids = itertools.count(1)
+        self._callbacks = {}
+        self.jobs = []
+        self._log_handler = _JobLogHandler()
+        logging.getLogger().addHandler(self._log_handler)
+
+    def is_active(self, key):
+        return any(job.active and job.key == key for job in self.jobs)
+
+    def submit(self, name, fn, *args, key=None, on_done=None, **kwargs):
+        # fn recibe progress=job.report para informar del avance y permitir cancelar.
+        # on_done(job) se llama en el hilo de la GUI al terminar.
+        if key is not None and self.is_active(key):
+            logging.warning(f"Ya hay una tarea en curso para {key}")
+            return None
+
+        job = Job(next(self._ids), name, key)
+        job.state_changed.connect(self._on_state_changed)
+        job.progress.connect(self._on_progress)
+        job.log.connect(self._on_log)
+        if on_done is not None:
+            self._callbacks[job.job_id] = on_done
+        self.jobs.append(job)
+        self.job_added.emit(job)
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.is_cancelled():
+            job._set_state(STATE_CANCELLED)
+            return
+        self._log_handler.bind(job)
+        job._set_state(STATE_RUNNING)
+        try:
+            job.result = fn(*args, progress=job.report, **kwargs)
+            job._set_state(STATE_CANCELLED if job.is_cancelled() else STATE_DONE)
+        except JobCancelled:
+            logging.info("Tarea cancelada")
+            job._set_state(STATE_CANCELLED)
+        except Exception as e:
+            logging.exception(f"Error en la tarea '{job.name}'")
+            job.error = e
+            job._set_state(STATE_FAILED)
+        finally:
+            self._log_handler.bind(None)
+
+    # Slots: se ejecutan en el hilo de la GUI
+    def _on_state_changed(self, state):
+        job = self.sender()
+        self.job_updated.emit(job)
+        if not job.active:
+            callback = self._callbacks.pop(job.job_id, None)
+            if callback is not None:
+                callback(job)
+
+    def _on_progress(self, message):
+        job = self.sender()
+        job.message = message
+        self.job_updated.emit(job)
+
+    def _on_log(self, line):
+        # log_lines es la única fuente: los diálogos leen la lista y luego siguen job_log
+        job = self.sender()
+        job.log_lines.append(line)
+        self.job_log.emit(job, line)
+
+    def cancel_all(self):
+        for job in self.jobs:
+            if job.active:
+                job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logging.getLogger().removeHandler(self._log_handler)
+
+
+class JobPanel(QWidget):
+    # Panel con la cola de tareas: estado, último mensaje y botones de control
+    show_log_requested = Signal(object)
+
+    def __init__(self, manager, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(3)
+        self.table.setHorizontalHeaderLabels(["Tarea", "Estado", "Progreso"])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.table.itemDoubleClicked.connect(self.show_selected_log)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.cancel_button = QPushButton("Cancelar tarea")
+        self.cancel_button.clicked.connect(self.cancel_selected)
+        buttons.addWidget(self.cancel_button)
+        self.log_button = QPushButton("Ver log")
+        self.log_button.clicked.connect(self.show_selected_log)
+        buttons.addWidget(self.log_button)
+        self.clear_button = QPushButton("Limpiar terminadas")
+        self.clear_button.clicked.connect(self.clear_finished)
+        buttons.addWidget(self.clear_button)
+        layout.addLayout(buttons)
+
+        self._rows = []
+        manager.job_added.connect(self.add_job)
+        manager.job_updated.connect(self.update_job)
+
+    def add_job(self, job):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self._rows.append(job)
+        self.update_job(job)
+
+    def update_job(self, job):
+        if job not in self._rows:
+            return
+        row = self._rows.index(job)
+        self.table.setItem(row, 0, QTableWidgetItem(job.name))
+        self.table.setItem(row, 1, QTableWidgetItem(job.state))
+        self.table.setItem(row, 2, QTableWidgetItem(job.message))
+
+    def selected_job(self):
+        rows = {item.row() for item in self.table.selectedItems()}
+        return self._rows[min(rows)] if rows else None
+
+    def cancel_selected(self):
+        job = self.selected_job()
+        if job is not None and job.active:
+            job.cancel()
+
+    def show_selected_log(self, *args):
+        job = self.selected_job()
+        if job is not None:
+            self.show_log_requested.emit(job)
+
+    def clear_finished(self):
+        for row in reversed(range(len(self._rows))):
+            if not self._rows[row].active:
+                self.table.removeRow(row)
+                del self._rows[row]
+        self.manager.jobs = [job for job in self.manager.jobs if job.active]
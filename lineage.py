@@ -0,0 +1,471 @@
+import os
+import re
+import sys
+import argparse
+import json
+import hashlib
+import logging
+import threading
+from collections import deque
+from script_store import SCRIPT_DIR, INDEX_FILE, LEGACY_SCRIPT, read_tab_index, _safe_filename
+
+# Grafo de dependencias (linaje) sobre las apps exportadas por export_app_objects.
+# Cada app de la carpeta raíz se analiza por objeto (pestaña de script, variable,
+# medida, dimensión, hoja) y el resultado se guarda en una caché en disco, de modo
+# que sólo se vuelven a analizar los ficheros y objetos que han cambiado.
+
+CACHE_FILE = ".lineage_cache.json"
+CACHE_VERSION = 4
+
+# Varias exportaciones en paralelo comparten el mismo fichero de caché
+_cache_lock = threading.Lock()
+
+TAB_PATTERN = re.compile(r"^///\$tab (.*)$", flags=re.MULTILINE)
+
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", flags=re.DOTALL)
+_LINE_COMMENT = re.compile(r"(?<![:/])//.*$", flags=re.MULTILINE)
+_REM_STATEMENT = re.compile(r"^\s*REM\b[^;]*;", flags=re.MULTILINE | re.IGNORECASE)
+_SINGLE_QUOTED = re.compile(r"'[^']*'")
+_VARIABLE_DEF = re.compile(r"^\s*(?:SET|LET)\s+([\w.$%#@]+|\[[^\]]+\])\s*=", flags=re.MULTILINE | re.IGNORECASE)
+_LOAD_STATEMENT = re.compile(
+    r"(\bMAPPING\s+)?\b(?:LOAD|SELECT)\b(?:\s+DISTINCT\b)?(.*?)"
+    r"(\bFROM\b|\bRESIDENT\b|\bINLINE\b|\bAUTOGENERATE\b|\bEXTENSION\b|;)",
+    flags=re.DOTALL | re.IGNORECASE
+)
+_INLINE_HEADER = re.compile(r"\s*([\[\"'])\s*([^\r\n]*)")
+_ALIAS = re.compile(r"\s+as\s+(\[[^\]]+\]|\"[^\"]+\"|[\w.$%#@]+)\s*$", flags=re.IGNORECASE)
+_IDENTIFIER = re.compile(r"^(\[[^\]]+\]|\"[^\"]+\"|[A-Za-z_%#@][\w.$%#@]*)$")
+_DOLLAR_EXPANSION = re.compile(r"\$\(\s*=?\s*([\w.]+)")
+_QUOTED_NAME = re.compile(r"\[([^\]]+)\]|\"([^\"]+)\"")
+_BARE_TOKEN = re.compile(r"[A-Za-z_%#@][\w.%#@]*")
+
+OBJECT_FILES = {
+    "variables.json": "variable",
+    "measures.json": "measure",
+    "dimensions.json": "dimension",
+    "sheets.json": "sheet",
+}
+
+EXPRESSION_KEYS = {"qDef", "qFieldDefs", "qExpression", "qLabelExpression", "qLabel", "qDefinition"}
+
+
+def _unquote(name):
+    name = name.strip()
+    if (name.startswith("[") and name.endswith("]")) or (name.startswith('"') and name.endswith('"')):
+        return name[1:-1].strip()
+    return name
+
+
+def _hash(value):
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def split_tabs(script):
+    # Devuelve [(nombre, texto)] respetando el orden de las marcas ///$tab
+    matches = list(TAB_PATTERN.finditer(script))
+    if not matches:
+        return [("Main", script)] if script.strip() else []
+    tabs = []
+    if script[:matches[0].start()].strip():
+        tabs.append((None, script[:matches[0].start()]))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(script)
+        tabs.append((match.group(1).strip(), script[match.end():end]))
+    return tabs
+
+
+def _split_top_level(text):
+    items, depth, current, quote = [], 0, [], None
+    for ch in text:
+        if quote:
+            current.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in "'\"":
+            quote = ch
+        elif ch == "[":
+            quote = "]"
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            items.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    items.append("".join(current))
+    return [item.strip() for item in items if item.strip()]
+
+
+def _mask_literals(text):
+    # Sustituye el contenido de los literales '...' por espacios sin cambiar las
+    # posiciones, para que un ';' o una palabra clave dentro de ellos no corte la sentencia
+    return _SINGLE_QUOTED.sub(lambda m: "'" + " " * (len(m.group(0)) - 2) + "'", text)
+
+
+def parse_script_tab(text):
+    # Campos cargados y variables definidas en una pestaña del script
+    clean = _BLOCK_COMMENT.sub(" ", text)
+    clean = _LINE_COMMENT.sub("", clean)
+    clean = _REM_STATEMENT.sub("", clean)
+    masked = _mask_literals(clean)
+
+    variables = sorted({_unquote(name) for name in _VARIABLE_DEF.findall(clean)})
+
+    fields = set()
+    for match in _LOAD_STATEMENT.finditer(masked):
+        mapping, terminator = match.group(1), match.group(3)
+        if mapping:
+            continue
+        # Las posiciones coinciden en ambos textos; la lista de campos se toma sin enmascarar
+        field_list = clean[match.start(2):match.end(2)]
+        if terminator.upper() == "INLINE" and field_list.strip() == "*":
+            # La cabecera suele ir en la línea siguiente al corchete o comilla de apertura
+            header = _INLINE_HEADER.match(clean, match.end())
+            if header:
+                closing = "]" if header.group(1) == "[" else header.group(1)
+                names = header.group(2).split(closing, 1)[0]
+                fields.update(_unquote(name) for name in names.split(",") if name.strip())
+            continue
+        for item in _split_top_level(field_list):
+            alias = _ALIAS.search(item)
+            if alias:
+                fields.add(_unquote(alias.group(1)))
+            elif _IDENTIFIER.match(item):
+                fields.add(_unquote(item))
+
+    return {"fields": sorted(fields), "variables": variables}
+
+
+def parse_expression(expression):
+    # Referencias candidatas de una expresión; se resuelven contra los campos y
+    # variables conocidos al montar el grafo
+    expression = expression.strip()
+    names = set()
+    if expression and not expression.startswith("="):
+        names.add(_unquote(expression))
+    variables = set(_DOLLAR_EXPANSION.findall(expression))
+    without_literals = _SINGLE_QUOTED.sub(" ", expression)
+    for bracketed, quoted in _QUOTED_NAME.findall(without_literals):
+        names.add((bracketed or quoted).strip())
+    without_names = _QUOTED_NAME.sub(" ", without_literals)
+    names.update(_BARE_TOKEN.findall(without_names))
+    return names, variables
+
+
+def _collect_refs(node, names, variables, library):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "qLibraryId" and isinstance(value, str) and value:
+                library.add(value)
+            elif key in EXPRESSION_KEYS:
+                for expression in (value if isinstance(value, list) else [value]):
+                    if isinstance(expression, str):
+                        found_names, found_vars = parse_expression(expression)
+                        names.update(found_names)
+                        variables.update(found_vars)
+                    else:
+                        _collect_refs(expression, names, variables, library)
+            else:
+                _collect_refs(value, names, variables, library)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_refs(value, names, variables, library)
+
+
+def parse_object(kind, obj):
+    props = obj.get("qProp", obj) if isinstance(obj, dict) else {}
+    names, variables, library = set(), set(), set()
+
+    if kind == "variable":
+        object_id = props.get("qName", "")
+        name = object_id
+        found_names, found_vars = parse_expression(props.get("qDefinition", "") or "")
+        names.update(found_names)
+        variables.update(found_vars)
+        names.discard(_unquote(props.get("qDefinition", "") or ""))
+    else:
+        object_id = props.get("qInfo", {}).get("qId", "")
+        if kind == "measure":
+            name = props.get("qMeasure", {}).get("qLabel") or props.get("qMetaDef", {}).get("title", "")
+        elif kind == "dimension":
+            name = props.get("qDim", {}).get("title") or props.get("qMetaDef", {}).get("title", "")
+        else:
+            name = props.get("qMetaDef", {}).get("title", "")
+        _collect_refs(props, names, variables, library)
+        # Hojas: los gráficos hijos vienen del árbol completo de propiedades
+        _collect_refs(obj.get("qChildren", []) if isinstance(obj, dict) else [], names, variables, library)
+
+    return {
+        "id": object_id,
+        "name": name or object_id,
+        "names": sorted(names),
+        "variables": sorted(variables),
+        "library": sorted(library),
+    }
+
+
+def _script_items(app_folder):
+    # [(clave, hash, cargador)] de cada pestaña; con el índice por pestañas el hash
+    # ya está guardado y las pestañas sin cambios no llegan a leerse
+    tabs = read_tab_index(app_folder)
+    if tabs is not None:
+        items = []
+        for tab in tabs:
+            path = os.path.join(app_folder, SCRIPT_DIR, tab["file"])
+
+            def load(path=path, name=tab["name"]):
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    return name, f.read()
+            items.append((tab["file"], tab["sha1"], load))
+        return items
+
+    # Exportaciones antiguas con script.qvs
+    legacy_path = os.path.join(app_folder, LEGACY_SCRIPT)
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        tabs = split_tabs(f.read())
+    # Misma clave que tendría la pestaña en el formato por ficheros
+    used = set()
+    return [(_safe_filename(name, used), _hash([name, text]), lambda tab=(name, text): tab) for name, text in tabs]
+
+
+def _script_signature(app_folder):
+    index_path = os.path.join(app_folder, SCRIPT_DIR, INDEX_FILE)
+    if os.path.exists(index_path):
+        return _file_signature(index_path)
+    legacy_path = os.path.join(app_folder, LEGACY_SCRIPT)
+    if os.path.exists(legacy_path):
+        return _file_signature(legacy_path)
+    return None
+
+
+def _file_signature(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _refresh_file(entry, signature, items, parse):
+    # items: [(clave, hash, cargador)]; sólo se cargan y analizan los objetos cuyo
+    # hash no estaba en la caché (así reordenar pestañas u objetos no obliga a
+    # analizarlos de nuevo)
+    previous = {cached["hash"]: cached for cached in (entry or {}).get("objects", {}).values()}
+    objects, parsed_count = {}, 0
+    for key, digest, load in items:
+        cached = previous.get(digest)
+        if cached:
+            objects[key] = cached
+        else:
+            objects[key] = {"hash": digest, "parsed": parse(load())}
+            parsed_count += 1
+    return {"signature": signature, "objects": objects}, parsed_count
+
+
+def _refresh_app(app_folder, app_cache):
+    files, parsed_count = {}, 0
+
+    signature = _script_signature(app_folder)
+    if signature is not None:
+        entry = app_cache.get("script")
+        if entry and entry["signature"] == signature:
+            files["script"] = entry
+        else:
+            files["script"], count = _refresh_file(
+                entry, signature, _script_items(app_folder),
+                lambda tab: dict(parse_script_tab(tab[1]), name=tab[0])
+            )
+            parsed_count += count
+
+    for fname, kind in OBJECT_FILES.items():
+        path = os.path.join(app_folder, fname)
+        if not os.path.exists(path):
+            continue
+        signature = _file_signature(path)
+        entry = app_cache.get(fname)
+        if entry and entry["signature"] == signature:
+            files[fname] = entry
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                objects = json.load(f)
+        except Exception as e:
+            logging.warning(f"No se pudo leer {path} para el linaje: {e}")
+            continue
+        items = [(str(i), _hash(obj), lambda obj=obj: obj) for i, obj in enumerate(objects)]
+        files[fname], count = _refresh_file(entry, signature, items, lambda obj, kind=kind: parse_object(kind, obj))
+        parsed_count += count
+
+    return files, parsed_count
+
+
+def load_cache(root):
+    path = os.path.join(root, CACHE_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if cache.get("version") == CACHE_VERSION:
+            return cache
+        logging.info("Versión de la caché de linaje obsoleta, se regenerará.")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"No se pudo leer la caché de linaje: {e}")
+    return {"version": CACHE_VERSION, "apps": {}}
+
+
+def save_cache(root, cache):
+    path = os.path.join(root, CACHE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+
+def refresh_lineage(root="exported", apps=None):
+    # Actualiza la caché de linaje de las apps indicadas (o de todas) y la devuelve
+    with _cache_lock:
+        return _refresh_lineage(root, apps)
+
+
+def _refresh_lineage(root, apps):
+    cache = load_cache(root)
+    if not os.path.isdir(root):
+        return cache
+
+    existing = sorted(
+        name for name in os.listdir(root)
+        if os.path.isdir(os.path.join(root, name))
+    )
+    for name in list(cache["apps"]):
+        if name not in existing:
+            del cache["apps"][name]
+
+    total = 0
+    for name in (apps if apps is not None else existing):
+        app_folder = os.path.join(root, name)
+        if not os.path.isdir(app_folder):
+            continue
+        cache["apps"][name], parsed_count = _refresh_app(app_folder, cache["apps"].get(name, {}))
+        total += parsed_count
+
+    save_cache(root, cache)
+    logging.info(f"Linaje actualizado: {total} objetos analizados de nuevo.")
+    return cache
+
+
+def build_graph(cache, app):
+    # Nodos "tipo:nombre" y aristas consumidor -> proveedor ("uses")
+    files = cache["apps"].get(app, {})
+    nodes, uses = {}, {}
+
+    def add_node(node_id, kind, name):
+        nodes.setdefault(node_id, {"type": kind, "name": name})
+        uses.setdefault(node_id, set())
+
+    def add_edge(consumer, provider):
+        uses[consumer].add(provider)
+
+    # Las pestañas se identifican por su fichero: puede haber varias con el mismo nombre
+    for key, entry in files.get("script", {}).get("objects", {}).items():
+        tab = entry["parsed"]
+        tab_id = f"tab:{key}"
+        add_node(tab_id, "tab", "(preámbulo)" if tab["name"] is None else tab["name"])
+        for field in tab["fields"]:
+            add_node(f"field:{field}", "field", field)
+            add_edge(f"field:{field}", tab_id)
+        for variable in tab["variables"]:
+            add_node(f"variable:{variable}", "variable", variable)
+            add_edge(f"variable:{variable}", tab_id)
+
+    parsed_objects = []
+    for fname, kind in OBJECT_FILES.items():
+        for entry in files.get(fname, {}).get("objects", {}).values():
+            parsed = entry["parsed"]
+            node_id = f"{kind}:{parsed['id']}"
+            add_node(node_id, kind, parsed["name"])
+            parsed_objects.append((node_id, parsed))
+
+    fields = {node["name"] for node in nodes.values() if node["type"] == "field"}
+    variables = {node["name"] for node in nodes.values() if node["type"] == "variable"}
+
+    for node_id, parsed in parsed_objects:
+        for name in parsed["names"]:
+            if name in fields:
+                add_edge(node_id, f"field:{name}")
+            elif name in variables and f"variable:{name}" != node_id:
+                add_edge(node_id, f"variable:{name}")
+        for variable in parsed["variables"]:
+            add_node(f"variable:{variable}", "variable", variable)
+            if f"variable:{variable}" != node_id:
+                add_edge(node_id, f"variable:{variable}")
+        for library_id in parsed["library"]:
+            for kind in ("measure", "dimension"):
+                if f"{kind}:{library_id}" in nodes:
+                    add_edge(node_id, f"{kind}:{library_id}")
+
+    return {"nodes": nodes, "uses": uses}
+
+
+def impact(graph, node_id):
+    # Todo lo que depende (directa o indirectamente) de node_id, p. ej. "field:Ventas"
+    dependents = {}
+    for consumer, providers in graph["uses"].items():
+        for provider in providers:
+            dependents.setdefault(provider, set()).add(consumer)
+
+    affected, queue = [], deque([node_id])
+    seen = {node_id}
+    while queue:
+        current = queue.popleft()
+        for consumer in sorted(dependents.get(current, ())):
+            if consumer not in seen:
+                seen.add(consumer)
+                affected.append(consumer)
+                queue.append(consumer)
+    return affected
+
+
+def impact_across_apps(cache, node_id):
+    # Impacto de node_id en todas las apps de la caché: {app: [nodos afectados]}
+    result = {}
+    for app in cache["apps"]:
+        graph = build_graph(cache, app)
+        if node_id in graph["nodes"]:
+            affected = impact(graph, node_id)
+            if affected:
+                result[app] = affected
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Análisis de impacto sobre el linaje de las apps exportadas")
+    parser.add_argument("node", help='Nodo a analizar, p. ej. "field:Ventas", "variable:vAño" o "tab:Main.qvs"')
+    parser.add_argument("--root", default="exported", help="Carpeta con las apps exportadas")
+    parser.add_argument("--app", help="Limitar el análisis a una app")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    cache = refresh_lineage(args.root)
+    if args.app:
+        graph = build_graph(cache, args.app)
+        result = {args.app: impact(graph, args.node)} if args.node in graph["nodes"] else {}
+    else:
+        result = impact_across_apps(cache, args.node)
+
+    if not result:
+        print(f"Nada depende de {args.node}")
+        return
+    for app, affected in sorted(result.items()):
+        graph = build_graph(cache, app)
+        print(f"{app}:")
+        for node_id in affected:
+            node = graph["nodes"][node_id]
+            print(f"  {node['type']:<10} {node['name']}  ({node_id})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
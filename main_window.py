@@ -3,23 +3,19 @@ from PySide6.QtWidgets import (
     QTableWidget, QTableWidgetItem, QPushButton, QTextEdit,
     QLabel, QMessageBox, QLineEdit, QHBoxLayout, QDialog, QVBoxLayout
 )
-from PySide6.QtCore import Qt, QTimer
+from PySide6.QtCore import Qt
 from PySide6.QtGui import QIcon, QColor, QPalette, QTextCursor
-from engine_exporter import export_app_objects, import_app_objects
-from concurrent.futures import ThreadPoolExecutor
+from engine_exporter import export_app, import_app_objects
+from qrs_client import connection_from_config, fetch_apps
+from job_manager import JobManager, JobPanel, STATE_DONE, STATE_FAILED
 
 from import_dialog import ImportDialog
 
 import configparser
-import requests
 import os
 import logging
-import urllib3
 import json
 import sys
-from io import StringIO
-
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
 logging.basicConfig(
@@ -31,9 +27,9 @@ logging.basicConfig(
 )
 
 class LogDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, job, manager, parent=None):
         super().__init__(parent)
-        self.setWindowTitle("Progreso de Importación")
+        self.setWindowTitle(f"Progreso – {job.name}")
         self.resize(600, 400)
         layout = QVBoxLayout(self)
         self.text_edit = QTextEdit(self)
@@ -43,24 +39,27 @@ class LogDialog(QDialog):
         self.close_button.setEnabled(False)
         self.close_button.clicked.connect(self.accept)
         layout.addWidget(self.close_button)
-        self.timer = QTimer(self)
-        self.timer.setInterval(200)
-        self.timer.timeout.connect(self.refresh_log)
-        self._stream = None
-
-    def start_stream(self, stream):
-        self._stream = stream
-        self.timer.start()
-
-    def refresh_log(self):
-        if self._stream:
-            self.text_edit.setPlainText(self._stream.getvalue())
-            from PySide6.QtGui import QTextCursor
+
+        # El gestor guarda las líneas en job.log_lines y las reenvía en el hilo de la
+        # GUI, así que copiar y conectar aquí no deja huecos
+        self.job = job
+        self._stopped = False
+        self.text_edit.setPlainText("\n".join(job.log_lines))
+        manager.job_log.connect(self.on_job_log)
+        manager.job_updated.connect(self.on_job_updated)
+        self.on_job_updated(job)
+
+    def on_job_log(self, job, line):
+        if job is self.job:
+            self.text_edit.append(line)
             self.text_edit.moveCursor(QTextCursor.End)
 
+    def on_job_updated(self, job):
+        if job is self.job and not job.active and not self._stopped:
+            self.stop(f"{job.name}: {job.state}")
+
     def stop(self, final_message=""):
-        self.timer.stop()
-        self._stream = None
+        self._stopped = True
         if final_message:
             self.text_edit.append("\n<b>" + final_message + "</b>")
         self.close_button.setEnabled(True)
@@ -127,6 +126,13 @@ class MainWindow(QMainWindow):
         self.save_config_button.clicked.connect(self.save_config)
         layout.addWidget(self.save_config_button)
 
+        # Cola de tareas en segundo plano
+        self.job_manager = JobManager(parent=self)
+        layout.addWidget(QLabel("Tareas"))
+        self.job_panel = JobPanel(self.job_manager)
+        self.job_panel.show_log_requested.connect(self.show_job_log)
+        layout.addWidget(self.job_panel)
+
         # Events
 
 
@@ -134,6 +140,10 @@ class MainWindow(QMainWindow):
 
 
         self.apps_data = []
+        # Servidor y conexión de los que proceden las apps de la tabla
+        self.apps_server = None
+        self.apps_conn = None
+        self._apps_load_id = None
 
         central_widget.setLayout(layout)
         self.setCentralWidget(central_widget)
@@ -157,26 +167,7 @@ class MainWindow(QMainWindow):
 
 
     def get_connection_details(self):
-        section = self.server_selector.currentText()
-        host = self.config.get(section, "host")
-        cert_file = self.config.get(section, "cert_file")
-        key_file = self.config.get(section, "key_file")
-        user_id = self.config.get(section, "user_id")
-        user_directory = self.config.get(section, "user_directory")
-        header_user = f"UserDirectory={user_directory};UserId={user_id}"
-        color = self.config.get(section, "color", fallback="#333333")
-        icon = self.config.get(section, "icon", fallback=None)
-
-        return {
-            "host": host,
-            "cert_file": cert_file,
-            "key_file": key_file,
-            "user_id": user_id,
-            "user_directory": user_directory,
-            "header_user": header_user,
-            "color": color,
-            "icon": icon
-        }
+        return connection_from_config(self.config, self.server_selector.currentText())
 
 
     def save_config(self):
@@ -199,26 +190,23 @@ class MainWindow(QMainWindow):
 
         row = selected[0].row()
         app = self.apps_data[row]
-        app_id = app.get("id")
         app_name = app.get("name").replace(" ", "_")
         output_folder = os.path.join("exported", app_name)
-        os.makedirs(output_folder, exist_ok=True)
-
-        try:
-            # Guardar metadata QRS
-            with open(os.path.join(output_folder, "metadata.json"), "w", encoding="utf-8") as f:
-                json.dump(app, f, indent=2)
 
-            # Conexión
-            conn = self.get_connection_details()
-            export_app_objects(app_id, output_folder, conn)
+        # Conexión del servidor del que se cargó la tabla, no del seleccionado ahora
+        conn = self.apps_conn
+        job = self.job_manager.submit(
+            f"Exportar {app_name}", export_app, app, output_folder, conn,
+            key=("app", app_name), on_done=lambda job: self.on_export_done(job, output_folder)
+        )
+        if job is None:
+            QMessageBox.warning(self, "Exportar", f"Ya hay una tarea en curso para '{app_name}'.")
 
-            QMessageBox.information(self, "Exportación completada",
-                                    f"Aplicación '{app_name}' exportada correctamente en:\n{output_folder}")
-            logging.info(f"Exportación completa para {app_name} ({app_id})")
-        except Exception as e:
-            logging.exception("Error al exportar la app:")
-            QMessageBox.critical(self, "Error", f"No se pudo exportar la app:\n{e}")
+    def on_export_done(self, job, output_folder):
+        if job.state == STATE_DONE:
+            self.statusBar().showMessage(f"{job.name}: exportada correctamente en {output_folder}", 10000)
+        elif job.state == STATE_FAILED:
+            QMessageBox.critical(self, "Error", f"No se pudo exportar la app:\n{job.error}")
 
 
     def import_selected_app(self):
@@ -238,29 +226,21 @@ class MainWindow(QMainWindow):
                                 f"No se encontró el directorio de exportación para '{app_name}' en:\n{input_folder}")
             return
 
-        log_stream = StringIO()
-        handler = logging.StreamHandler(log_stream)
-        handler.setLevel(logging.INFO)
-        logging.getLogger().addHandler(handler)
-
-        log_dialog = LogDialog(self)
-        log_dialog.start_stream(log_stream)
-        log_dialog.show()
+        conn = self.apps_conn
+        job = self.job_manager.submit(
+            f"Importar {app_name}", import_app_objects, app_id, input_folder, conn,
+            key=("app", app_name)
+        )
+        if job is None:
+            QMessageBox.warning(self, "Importar", f"Ya hay una tarea en curso para '{app_name}'.")
+            return
+        self.show_job_log(job)
 
-        def import_task():
-            try:
-                conn = self.get_connection_details()
-                import_app_objects(app_id, input_folder, conn)
-                logging.info("\n✔️ Importación finalizada con éxito")
-                log_dialog.stop("✔️ Importación completada")
-            except Exception as e:
-                logging.exception("❌ Error durante la importación")
-                log_dialog.stop("❌ Error durante la importación")
-            finally:
-                logging.getLogger().removeHandler(handler)
 
-        executor = ThreadPoolExecutor(max_workers=1)
-        executor.submit(import_task)
+    def show_job_log(self, job):
+        log_dialog = LogDialog(job, self.job_manager, self)
+        log_dialog.setAttribute(Qt.WA_DeleteOnClose)
+        log_dialog.show()
 
 
     def load_apps(self):
@@ -269,57 +249,51 @@ class MainWindow(QMainWindow):
         try:
             conn = self.get_connection_details()
             logging.debug(f"Datos de conexión: {conn}")
-
-            xrfkey = "123456789ABCDEFG"
-            url = f"{conn['host']}/qrs/app/full?xrfkey={xrfkey}"
-            headers = {
-                "X-Qlik-User": conn["header_user"],
-                "X-Qlik-Xrfkey": xrfkey,
-                "Content-Type": "application/json"
-            }
-            logging.debug(f"Haciendo GET a: {url}")
-            logging.debug(f"Cabeceras: {headers}")
-
-            response = requests.get(
-                url,
-                cert=(conn["cert_file"], conn["key_file"]),
-                verify=False,
-                headers=headers,
-                timeout=10
-            )
-
-            logging.info(f"Respuesta HTTP: {response.status_code}")
-
-            if response.status_code == 200:
-                try:
-                    self.apps_data = response.json()
-                    self.app_table.setRowCount(len(self.apps_data))
-                    logging.info(f"Se recibieron {len(self.apps_data)} aplicaciones")
-                    for row, app in enumerate(self.apps_data):
-                        nombre = app.get("name", "")
-                        stream_data = app.get("stream")
-                        stream = stream_data.get("name") if stream_data else "Personal"
-                        publicado = app.get("publishTime", "") or "-"
-                        refresco = app.get("lastReloadTime", "") or "-"
-
-                        self.app_table.setItem(row, 0, QTableWidgetItem(nombre))
-                        self.app_table.setItem(row, 1, QTableWidgetItem(app.get("id", "")))
-                        self.app_table.setItem(row, 2, QTableWidgetItem(stream))
-                        self.app_table.setItem(row, 3, QTableWidgetItem(publicado))
-                        self.app_table.setItem(row, 4, QTableWidgetItem(refresco))
-
-                    self.update_theme_for_server()
-                except Exception as e:
-                    logging.exception("Error al parsear JSON:")
-                    QMessageBox.critical(self, "Error JSON", f"No se pudo decodificar el JSON:\n{response.text}")
-            else:
-                logging.warning(f"Respuesta no exitosa: {response.status_code}")
-                logging.debug(response.text)
-                QMessageBox.warning(self, "Error", f"HTTP {response.status_code}:\n{response.text}")
-
         except Exception as e:
             logging.exception("Excepción durante la carga de apps")
             QMessageBox.critical(self, "Error", f"No se pudieron cargar las aplicaciones:\n{e}")
+            return
+
+        server = self.server_selector.currentText()
+        job = self.job_manager.submit(
+            f"Cargar aplicaciones ({server})", fetch_apps, conn,
+            key=("load_apps", server),
+            on_done=lambda job: self.on_apps_loaded(job, server, conn)
+        )
+        if job is not None:
+            self._apps_load_id = job.job_id
+            self.load_apps_button.setEnabled(False)
+
+    def on_apps_loaded(self, job, server, conn):
+        # Sólo cuenta la última carga lanzada
+        if job.job_id != self._apps_load_id:
+            return
+        self.load_apps_button.setEnabled(True)
+        if job.state == STATE_FAILED:
+            QMessageBox.critical(self, "Error", f"No se pudieron cargar las aplicaciones:\n{job.error}")
+            return
+        if job.state != STATE_DONE:
+            return
+
+        self.apps_data = job.result
+        self.apps_server = server
+        self.apps_conn = conn
+        self.app_table.setRowCount(len(self.apps_data))
+        logging.info(f"Se recibieron {len(self.apps_data)} aplicaciones")
+        for row, app in enumerate(self.apps_data):
+            nombre = app.get("name", "")
+            stream_data = app.get("stream")
+            stream = stream_data.get("name") if stream_data else "Personal"
+            publicado = app.get("publishTime", "") or "-"
+            refresco = app.get("lastReloadTime", "") or "-"
+
+            self.app_table.setItem(row, 0, QTableWidgetItem(nombre))
+            self.app_table.setItem(row, 1, QTableWidgetItem(app.get("id", "")))
+            self.app_table.setItem(row, 2, QTableWidgetItem(stream))
+            self.app_table.setItem(row, 3, QTableWidgetItem(publicado))
+            self.app_table.setItem(row, 4, QTableWidgetItem(refresco))
+
+        self.update_theme_for_server(server)
 
 
     def show_app_details(self, item):
@@ -362,6 +336,7 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event):
         self.save_ui_settings()
+        self.job_manager.shutdown()
         super().closeEvent(event)
 
 
@@ -417,8 +392,8 @@ class MainWindow(QMainWindow):
             logging.warning(f"No se pudieron cargar ajustes de UI: {e}")
 
 
-    def update_theme_for_server(self):
-        conn = self.get_connection_details()
+    def update_theme_for_server(self, server):
+        conn = connection_from_config(self.config, server)
 
         # Cambiar ícono
         if conn["icon"]:
@@ -433,10 +408,10 @@ class MainWindow(QMainWindow):
         self.setPalette(palette)
 
         # (Opcional) Actualizar título con nombre del servidor
-        self.setWindowTitle(f"Qlik Version Control – {self.server_selector.currentText()}")
+        self.setWindowTitle(f"Qlik Version Control – {server}")
 
         # Mostrar el entorno (nombre de la sección actual)
-        entorno = self.server_selector.currentText()
+        entorno = server
         self.env_label.setText(f"Entorno: {entorno.upper()}")
         self.env_label.setStyleSheet(f"""
             font-weight: bold;
@@ -0,0 +1,66 @@
+import requests
+import logging
+import urllib3
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def connection_from_config(config, section):
+    host = config.get(section, "host")
+    cert_file = config.get(section, "cert_file")
+    key_file = config.get(section, "key_file")
+    user_id = config.get(section, "user_id")
+    user_directory = config.get(section, "user_directory")
+    header_user = f"UserDirectory={user_directory};UserId={user_id}"
+    color = config.get(section, "color", fallback="#333333")
+    icon = config.get(section, "icon", fallback=None)
+
+    return {
+        "host": host,
+        "cert_file": cert_file,
+        "key_file": key_file,
+        "user_id": user_id,
+        "user_directory": user_directory,
+        "header_user": header_user,
+        "color": color,
+        "icon": icon
+    }
+
+
+def fetch_apps(conn, progress=None, qrs_filter=None):
+    # qrs_filter permite pedir sólo las apps que cumplan una condición QRS,
+    # p. ej. "modifiedDate gt '2024-01-01T00:00:00.000Z'"
+    xrfkey = "123456789ABCDEFG"
+    url = f"{conn['host']}/qrs/app/full?xrfkey={xrfkey}"
+    params = {"filter": qrs_filter} if qrs_filter else None
+    headers = {
+        "X-Qlik-User": conn["header_user"],
+        "X-Qlik-Xrfkey": xrfkey,
+        "Content-Type": "application/json"
+    }
+    logging.debug(f"Haciendo GET a: {url}")
+    logging.debug(f"Cabeceras: {headers}")
+    if progress:
+        progress("Consultando QRS...")
+
+    response = requests.get(
+        url,
+        cert=(conn["cert_file"], conn["key_file"]),
+        verify=False,
+        headers=headers,
+        params=params,
+        timeout=10
+    )
+
+    logging.info(f"Respuesta HTTP: {response.status_code}")
+
+    if response.status_code != 200:
+        logging.warning(f"Respuesta no exitosa: {response.status_code}")
+        logging.debug(response.text)
+        raise RuntimeError(f"HTTP {response.status_code}:\n{response.text}")
+
+    try:
+        return response.json()
+    except Exception:
+        logging.exception("Error al parsear JSON:")
+        raise RuntimeError(f"No se pudo decodificar el JSON:\n{response.text}")
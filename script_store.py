@@ -0,0 +1,167 @@
+import os
+import io
+import re
+import json
+import hashlib
+import logging
+
+# Almacenamiento del script de carga en un fichero por pestaña (///$tab) más un
+# índice ordenado. El troceado se hace línea a línea, sin mantener el script
+# entero en memoria, y la concatenación de las pestañas reproduce el script
+# original byte a byte.
+
+SCRIPT_DIR = "script"
+INDEX_FILE = "index.json"
+LEGACY_SCRIPT = "script.qvs"
+TAB_MARKER = "///$tab "
+
+# Nombres de dispositivo reservados en Windows, con cualquier extensión
+_RESERVED_NAMES = {"CON", "PRN", "AUX", "NUL"} | {f"COM{i}" for i in range(1, 10)} | {f"LPT{i}" for i in range(1, 10)}
+
+
+def _safe_filename(name, used):
+    if name is None:
+        base = "_preambulo"
+    else:
+        base = re.sub(r"[^\w\-. ]", "_", name).strip(" .") or "sin_nombre"
+        stem, dot, rest = base.partition(".")
+        if stem.strip().upper() in _RESERVED_NAMES:
+            base = f"{stem}_{dot}{rest}"
+    candidate, n = base, 2
+    while candidate.lower() in used:
+        candidate = f"{base}_{n}"
+        n += 1
+    used.add(candidate.lower())
+    return candidate + ".qvs"
+
+
+def read_tab_index(folder):
+    path = os.path.join(folder, SCRIPT_DIR, INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    # Un índice dañado se trata como inexistente para que la siguiente exportación lo rehaga
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tabs = json.load(f)["tabs"]
+        if all(isinstance(tab, dict) and "file" in tab and "sha1" in tab for tab in tabs):
+            return tabs
+        logging.warning(f"Índice de pestañas con formato inesperado: {path}")
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.warning(f"No se pudo leer el índice de pestañas {path}: {e}")
+    return None
+
+
+def split_script(lines, output_folder):
+    # lines: iterable de líneas con su salto de línea original
+    script_dir = os.path.join(output_folder, SCRIPT_DIR)
+    os.makedirs(script_dir, exist_ok=True)
+
+    previous = {tab["file"]: tab["sha1"] for tab in (read_tab_index(output_folder) or [])}
+    tabs, used = [], set()
+    written = skipped = 0
+    current = None
+
+    def start_tab(name):
+        tmp_path = os.path.join(script_dir, f".tab{len(tabs)}.tmp")
+        return {
+            "name": name,
+            "file": _safe_filename(name, used),
+            "hash": hashlib.sha1(),
+            "tmp": tmp_path,
+            "handle": open(tmp_path, "w", encoding="utf-8", newline=""),
+        }
+
+    def finish_tab(tab):
+        nonlocal written, skipped
+        tab["handle"].close()
+        sha1 = tab["hash"].hexdigest()
+        target = os.path.join(script_dir, tab["file"])
+        if previous.get(tab["file"]) == sha1 and os.path.exists(target):
+            os.remove(tab["tmp"])
+            skipped += 1
+        else:
+            os.replace(tab["tmp"], target)
+            written += 1
+        tabs.append({"name": tab["name"], "file": tab["file"], "sha1": sha1})
+
+    try:
+        for line in lines:
+            if line.startswith(TAB_MARKER) or current is None:
+                if current is not None:
+                    finish_tab(current)
+                # Texto previo a la primera marca ///$tab -> name None
+                name = line[len(TAB_MARKER):].strip() if line.startswith(TAB_MARKER) else None
+                current = start_tab(name)
+            current["handle"].write(line)
+            current["hash"].update(line.encode("utf-8"))
+        if current is not None:
+            finish_tab(current)
+    except Exception:
+        if current is not None and not current["handle"].closed:
+            current["handle"].close()
+            os.remove(current["tmp"])
+        raise
+
+    index_path = os.path.join(script_dir, INDEX_FILE)
+    with open(index_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"tabs": tabs}, f, indent=2, ensure_ascii=False)
+    os.replace(index_path + ".tmp", index_path)
+
+    # Borrar pestañas que ya no existen y temporales de ejecuciones interrumpidas
+    keep = {tab["file"] for tab in tabs}
+    for fname in os.listdir(script_dir):
+        stale_tab = fname.endswith(".qvs") and fname not in keep
+        stale_tmp = fname.startswith(".tab") and fname.endswith(".tmp")
+        if stale_tab or stale_tmp:
+            os.remove(os.path.join(script_dir, fname))
+
+    logging.info(f"Script dividido en {len(tabs)} pestañas ({written} escritas, {skipped} sin cambios).")
+    return tabs
+
+
+def write_script(script, output_folder):
+    tabs = split_script(io.StringIO(script, newline=""), output_folder)
+    # El script completo ya no se guarda como un único fichero
+    legacy_path = os.path.join(output_folder, LEGACY_SCRIPT)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+    return tabs
+
+
+def has_script(folder):
+    return read_tab_index(folder) is not None or os.path.exists(os.path.join(folder, LEGACY_SCRIPT))
+
+
+def iter_script_tabs(folder):
+    # (nombre, ruta) de cada pestaña en orden; exportaciones antiguas -> script.qvs
+    tabs = read_tab_index(folder)
+    if tabs is None:
+        legacy_path = os.path.join(folder, LEGACY_SCRIPT)
+        if os.path.exists(legacy_path):
+            yield "", legacy_path
+        return
+    for tab in tabs:
+        yield tab["name"], os.path.join(folder, SCRIPT_DIR, tab["file"])
+
+
+def read_script(folder):
+    parts = []
+    for _, path in iter_script_tabs(folder):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            parts.append(f.read())
+    return "".join(parts)
+
+
+def script_tab_names(folder):
+    tabs = read_tab_index(folder)
+    if tabs is not None:
+        return [tab["name"] for tab in tabs if tab["name"] is not None]
+    # Exportaciones antiguas: recorrer script.qvs línea a línea
+    names = []
+    legacy_path = os.path.join(folder, LEGACY_SCRIPT)
+    if os.path.exists(legacy_path):
+        with open(legacy_path, "r", encoding="utf-8", newline="") as f:
+            for line in f:
+                if line.startswith(TAB_MARKER):
+                    names.append(line[len(TAB_MARKER):].strip())
+    return names
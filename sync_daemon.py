@@ -0,0 +1,301 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import heapq
+import argparse
+import itertools
+import threading
+import configparser
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from engine_exporter import export_app
+from qrs_client import connection_from_config, fetch_apps
+
+# Modo de sincronización continua: espejo de todas las apps de todos los
+# servidores de config.ini. Cada servidor se consulta periódicamente en QRS
+# pidiendo sólo las apps con modifiedDate/lastReloadTime posteriores a la última
+# consulta; las apps cambiadas entran en una cola de prioridad (PRD primero, la
+# más reciente primero) y se exportan con un pool acotado por servidor y un
+# límite de exportaciones por minuto para no sobrecargar los Engine.
+
+STATE_FILE = ".sync_state.json"
+DEFAULT_INTERVAL = 60
+DEFAULT_WORKERS = 2
+DEFAULT_EXPORTS_PER_MINUTE = 6
+FULL_POLL_EVERY = 60
+# Proporción mínima de apps conocidas que debe devolver una consulta completa para borrar
+PRUNE_MIN_RATIO = 0.5
+
+
+def _timestamp(value):
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _app_folder_name(app):
+    # Por id: el nombre no es único en el servidor y puede cambiar (metadata.json lo guarda)
+    return app["id"]
+
+
+def _change_stamp(app):
+    return [app.get("modifiedDate") or "", app.get("lastReloadTime") or ""]
+
+
+class RateLimiter:
+    # Separa el inicio de dos exportaciones al menos 60 / per_minute segundos
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+
+    def try_acquire(self):
+        now = time.monotonic()
+        if now < self._next:
+            return False
+        self._next = now + self.interval
+        return True
+
+
+class ServerMirror:
+    def __init__(self, config, section, root):
+        self.section = section
+        self.conn = connection_from_config(config, section)
+        self.folder = os.path.join(root, re.sub(r"[^\w\-.]", "_", section))
+        self.priority = config.getint(section, "sync_priority", fallback=0 if "PRD" in section.upper() else 1)
+        self.workers = config.getint(section, "sync_workers", fallback=DEFAULT_WORKERS)
+        self.rate = RateLimiter(config.getfloat(section, "sync_exports_per_minute", fallback=DEFAULT_EXPORTS_PER_MINUTE))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"sync-{self.section}")
+        self.in_flight = set()
+        # Marca (modifiedDate, lastReloadTime) de cada exportación en curso
+        self.pending = {}
+        self.failed = {}
+        # Apps que faltaron en la última consulta completa, pendientes de confirmar
+        self.missing = set()
+        self.polls = 0
+        self.next_poll = 0.0
+        self._lock = threading.Lock()
+        self.state = self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.folder, STATE_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.warning(f"[{self.section}] No se pudo leer el estado de sincronización: {e}")
+        return {"high_water": "", "apps": {}}
+
+    def save_state(self):
+        with self._lock:
+            os.makedirs(self.folder, exist_ok=True)
+            path = os.path.join(self.folder, STATE_FILE)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(path + ".tmp", path)
+
+    def poll(self):
+        # Consulta incremental; cada FULL_POLL_EVERY consultas se pide la lista completa
+        # para recuperar cambios que el filtro pudiera haber perdido
+        high_water = self.state.get("high_water")
+        qrs_filter = None
+        if high_water and self.polls % FULL_POLL_EVERY != 0:
+            qrs_filter = f"modifiedDate gt '{high_water}' or lastReloadTime gt '{high_water}'"
+        self.polls += 1
+
+        apps = fetch_apps(self.conn, qrs_filter=qrs_filter)
+        if qrs_filter is None:
+            self.prune({app["id"] for app in apps})
+        with self._lock:
+            # Las exportaciones fallidas se reintentan aunque el filtro ya no las devuelva
+            changed = dict(self.failed)
+            self.failed.clear()
+            for app in apps:
+                stamp = _change_stamp(app)
+                # Ya se está exportando esta misma versión
+                if self.pending.get(app["id"]) == stamp:
+                    changed.pop(app["id"], None)
+                    continue
+                if app["id"] in changed or self.state["apps"].get(app["id"]) != stamp:
+                    changed[app["id"]] = app
+                high_water = max([high_water or ""] + [s for s in stamp if s])
+            self.state["high_water"] = high_water
+        logging.info(f"[{self.section}] {len(apps)} apps consultadas, {len(changed)} con cambios.")
+        return list(changed.values())
+
+    def prune(self, existing_ids):
+        # Con la lista completa: borrar del espejo y del estado las apps que ya no existen.
+        # Una lista vacía o mucho más corta de lo esperado (permisos del usuario de
+        # servicio, fallo de QRS...) no borra nada, y una app sólo se borra si falta en
+        # dos consultas completas seguidas
+        with self._lock:
+            known = len(self.state["apps"])
+        if not existing_ids or len(existing_ids) < known * PRUNE_MIN_RATIO:
+            logging.warning(
+                f"[{self.section}] QRS devolvió {len(existing_ids)} apps de {known} conocidas; no se eliminará nada del espejo."
+            )
+            self.missing = set()
+            return
+
+        with self._lock:
+            busy = set(self.in_flight)
+            candidates = {app_id for app_id in self.state["apps"] if app_id not in existing_ids and app_id not in busy}
+        if os.path.isdir(self.folder):
+            for name in os.listdir(self.folder):
+                # Sólo carpetas de exportación
+                if name not in existing_ids and name not in busy and os.path.exists(os.path.join(self.folder, name, "metadata.json")):
+                    candidates.add(name)
+        removed = candidates & self.missing
+        self.missing = candidates - removed
+        if self.missing:
+            logging.info(f"[{self.section}] {len(self.missing)} apps no encontradas; se eliminarán si siguen sin aparecer.")
+        if not removed:
+            return
+
+        with self._lock:
+            for app_id in removed:
+                self.state["apps"].pop(app_id, None)
+                self.failed.pop(app_id, None)
+        for app_id in sorted(removed):
+            path = os.path.join(self.folder, app_id)
+            if os.path.isdir(path):
+                logging.info(f"[{self.section}] Eliminando del espejo: {app_id}")
+                shutil.rmtree(path, ignore_errors=True)
+        logging.info(f"[{self.section}] {len(removed)} apps eliminadas del servidor.")
+        self.save_state()
+
+    def export(self, app):
+        output_folder = os.path.join(self.folder, _app_folder_name(app))
+        try:
+            export_app(app, output_folder, self.conn)
+            with self._lock:
+                self.state["apps"][app["id"]] = _change_stamp(app)
+            self.save_state()
+        except Exception:
+            # Sin actualizar el estado: se reintentará en la siguiente consulta
+            logging.exception(f"[{self.section}] Error al exportar {app.get('name')} ({app.get('id')})")
+            with self._lock:
+                self.failed[app["id"]] = app
+        finally:
+            with self._lock:
+                self.in_flight.discard(app["id"])
+                self.pending.pop(app["id"], None)
+
+    def can_start(self):
+        with self._lock:
+            busy = len(self.in_flight) >= self.workers
+        return not busy and self.rate.try_acquire()
+
+    def start(self, app):
+        with self._lock:
+            self.in_flight.add(app["id"])
+            self.pending[app["id"]] = _change_stamp(app)
+        self.executor.submit(self.export, app)
+
+    def is_in_flight(self, app_id):
+        with self._lock:
+            return app_id in self.in_flight
+
+
+class SyncDaemon:
+    def __init__(self, config, root="mirror", interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.servers = [ServerMirror(config, section, root) for section in config.sections()]
+        self._queue = []
+        self._queued = {}
+        self._seq = itertools.count()
+        self._stop = threading.Event()
+
+    def enqueue(self, server, app):
+        # Prioridad: servidor (PRD primero) y cambio más reciente primero. Si la app
+        # ya estaba en cola, la entrada antigua queda obsoleta y se descarta al salir
+        key = (server.section, app["id"])
+        changed = max(_timestamp(app.get("modifiedDate")), _timestamp(app.get("lastReloadTime")))
+        seq = next(self._seq)
+        self._queued[key] = seq
+        heapq.heappush(self._queue, (server.priority, -changed, seq, server, app))
+
+    def poll_due(self):
+        now = time.monotonic()
+        for server in self.servers:
+            if now < server.next_poll:
+                continue
+            server.next_poll = now + self.interval
+            try:
+                for app in server.poll():
+                    self.enqueue(server, app)
+            except Exception as e:
+                logging.warning(f"[{server.section}] No se pudo consultar QRS: {e}")
+
+    def dispatch(self):
+        # Arranca las exportaciones de mayor prioridad cuyo servidor tenga hueco
+        deferred = []
+        while self._queue:
+            item = heapq.heappop(self._queue)
+            _, _, seq, server, app = item
+            key = (server.section, app["id"])
+            if self._queued.get(key) != seq:
+                continue
+            if server.is_in_flight(app["id"]) or not server.can_start():
+                deferred.append(item)
+                continue
+            del self._queued[key]
+            logging.info(f"[{server.section}] Exportando {app.get('name')} ({app['id']})")
+            server.start(app)
+        for item in deferred:
+            heapq.heappush(self._queue, item)
+
+    def idle(self):
+        return not self._queue and not any(server.in_flight for server in self.servers)
+
+    def run(self, once=False):
+        logging.info(f"Sincronización iniciada para {len(self.servers)} servidores.")
+        try:
+            while not self._stop.is_set():
+                self.poll_due()
+                self.dispatch()
+                if once and self.idle() and all(server.polls for server in self.servers):
+                    break
+                self._stop.wait(1)
+        finally:
+            for server in self.servers:
+                server.executor.shutdown(wait=True, cancel_futures=True)
+                server.save_state()
+            logging.info("Sincronización detenida.")
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Espejo continuo de las apps de todos los servidores de config.ini")
+    parser.add_argument("--config", default="config.ini")
+    parser.add_argument("--root", default="mirror", help="Carpeta destino del espejo")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="Segundos entre consultas a QRS")
+    parser.add_argument("--once", action="store_true", help="Una sola pasada y salir")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(threadName)s %(message)s"
+    )
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    daemon = SyncDaemon(config, root=args.root, interval=args.interval)
+    try:
+        daemon.run(once=args.once)
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())